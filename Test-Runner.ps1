@@ -41,6 +41,10 @@ $testNames = @(
     "wrong_checksum",
     "quoted_fields",
     "misquoted_fields",
+    "quoted_padded_fields",
+    "unterminated_quote",
+    "redirected_file",
+    "redirected_empty_file",
     "mixed_5k"
 )
 
@@ -66,6 +70,10 @@ $testCases = @(
     "Get-Content tests/wrong_checksum.csv | $program",
     "Get-Content tests/quoted_fields.csv | $program",
     "Get-Content tests/misquoted_fields.csv | $program",
+    "Get-Content tests/quoted_padded_fields.csv | $program",
+    "Get-Content tests/unterminated_quote.csv | $program",
+    "cmd /c '$program < tests\all_valid.csv'",
+    "cmd /c '$program < tests\empty.csv'",
     "(Invoke-WebRequest -URI https://stockly-public-assets.s3.eu-west-1.amazonaws.com/peer-programming-mixed.csv).Content | $program"
 )
 
@@ -91,6 +99,10 @@ $expectedOutputs = @(
     "8 2",
     "10 0",
     "5 1",
+    "9 1",
+    "0 1",
+    "10 0",
+    "0 0",
     "4975 18"
 )
 
@@ -108,6 +108,11 @@ declare -a TEST_NAMES=(
     "wrong_checksum"
     "quoted_fields"
     "misquoted_fields"
+    "quoted_padded_fields"
+    "unterminated_quote"
+    "redirected_file"
+    "redirected_empty_file"
+    "redirected_file_offset"
     "mixed_5k"
 )
 
@@ -135,6 +140,11 @@ declare -a TEST_CASES=(
     "cat tests/wrong_checksum.csv | $PROGRAM"
     "cat tests/quoted_fields.csv | $PROGRAM"
     "cat tests/misquoted_fields.csv | $PROGRAM"
+    "cat tests/quoted_padded_fields.csv | $PROGRAM"
+    "cat tests/unterminated_quote.csv | $PROGRAM"
+    "$PROGRAM < tests/all_valid.csv"
+    "$PROGRAM < tests/empty.csv"
+    "(head -c 77 > /dev/null; $PROGRAM) < tests/all_valid.csv"
     "curl https://stockly-public-assets.s3.eu-west-1.amazonaws.com/peer-programming-mixed.csv | $PROGRAM"
 )
 
@@ -162,6 +172,11 @@ declare -a EXPECTED_OUTPUTS=(
     "8 2"
     "10 0"
     "5 1"
+    "9 1"
+    "0 1"
+    "10 0"
+    "0 0"
+    "9 0"
     "4976 17"
 )
 